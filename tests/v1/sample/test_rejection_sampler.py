@@ -6,7 +6,8 @@ import torch
 import torch.nn.functional as F
 
 from vllm.v1.sample.metadata import SamplingMetadata
-from vllm.v1.sample.rejection_sampler import (PLACEHOLDER_TOKEN_ID,
+from vllm.v1.sample.rejection_sampler import (GREEDY_TEMPERATURE,
+                                              PLACEHOLDER_TOKEN_ID,
                                               RejectionSampler)
 from vllm.v1.spec_decode.metadata import SpecDecodeMetadata
 
@@ -40,20 +41,24 @@ def create_sampling_metadata(
     top_p: Optional[torch.Tensor] = None,
     generators: Optional[dict[int, Any]] = None,
 ) -> SamplingMetadata:
-    """Create a v1 sampling metadata object with all_greedy set 
-        to the given value. Either all greedy or all random sampling 
-        is used.
+    """Create a v1 sampling metadata object with all_greedy set
+        to the given value. When all_greedy is False, the temperatures
+        determine the mix: entries equal to GREEDY_TEMPERATURE mark greedy
+        requests, everything else random.
     """
     generators = generators or {}
     if all_greedy:
         temperature = None
+        all_random = False
     else:
         assert temperature is not None
+        all_random = bool((temperature != GREEDY_TEMPERATURE).all())
 
     return SamplingMetadata(
         temperature=temperature,
+        temperature_cpu=None if temperature is None else temperature.cpu(),
         all_greedy=all_greedy,
-        all_random=not all_greedy,
+        all_random=all_random,
         top_p=top_p,
         top_k=top_k,
         min_p=torch.empty(1, ),
@@ -608,3 +613,118 @@ def test_top_p(rejection_sampler, top_p):
         unmasked_indices=top_p_indices,
         sampling_metadata=sampling_metadata,
     )
+
+
+########################### Tests for CUDA Graphs ######################
+def test_cuda_graph_replay_matches_eager():
+    """Graph replay must keep matching the eager path when the inputs
+    change between calls of the same shape."""
+    graph_sampler = RejectionSampler()
+    eager_sampler = RejectionSampler()
+    # Pin the reference sampler to the eager path.
+    eager_sampler._use_cuda_graph = lambda *args: False
+
+    for step in range(5):
+        spec_tokens = [[10 + step, 20 + step], [30 + step]]
+        output_tokens = [[10 + step, 20 + step, 1], [30 + step, 2]]
+        metadata = create_sampling_metadata(
+            all_greedy=False,
+            temperature=torch.ones(len(spec_tokens),
+                                   dtype=torch.float32,
+                                   device=DEVICE))
+        logits = create_logits_tensor(output_tokens)
+        bonus_token_tensor = torch.tensor(
+            [tokens[-1] for tokens in output_tokens], device=DEVICE)
+        spec_decode_metadata = SpecDecodeMetadata.make_dummy(spec_tokens,
+                                                            device=DEVICE)
+
+        graph_output = graph_sampler(
+            spec_decode_metadata,
+            draft_probs=None,
+            target_logits=logits.clone(),
+            bonus_token_ids=bonus_token_tensor,
+            sampling_metadata=metadata,
+        )
+        eager_output = eager_sampler(
+            spec_decode_metadata,
+            draft_probs=None,
+            target_logits=logits,
+            bonus_token_ids=bonus_token_tensor,
+            sampling_metadata=metadata,
+        )
+        assert torch.equal(graph_output, eager_output)
+    # The shape repeats across steps, so the graph path must have captured
+    # after its single eager warmup run.
+    assert len(graph_sampler._graph_cache) == 1
+
+
+def test_cuda_graph_cache_budget_fallback():
+    """Once the byte budget is exhausted, new shapes must keep running
+    eagerly and still produce correct outputs."""
+    rejection_sampler = RejectionSampler()
+    rejection_sampler.MAX_GRAPH_CACHE_BYTES = 0
+
+    spec_tokens = [[1, 2]]
+    output_tokens = [[1, 2, 3]]
+    expected = torch.tensor([[1, 2, 3]], dtype=torch.int, device=DEVICE)
+    for _ in range(3):
+        metadata = create_sampling_metadata(
+            all_greedy=False,
+            temperature=torch.ones(1, dtype=torch.float32, device=DEVICE))
+        logits = create_logits_tensor(output_tokens)
+        bonus_token_tensor = torch.tensor(
+            [tokens[-1] for tokens in output_tokens], device=DEVICE)
+        spec_decode_metadata = SpecDecodeMetadata.make_dummy(spec_tokens,
+                                                            device=DEVICE)
+        output = rejection_sampler(
+            spec_decode_metadata,
+            draft_probs=None,
+            target_logits=logits,
+            bonus_token_ids=bonus_token_tensor,
+            sampling_metadata=metadata,
+        )
+        assert torch.equal(output, expected)
+    assert not rejection_sampler._graph_cache
+
+
+########################### Tests for Mixed Batches ####################
+def test_mixed_greedy_and_random_batch(rejection_sampler):
+    """Mixed batches route greedy requests through the argmax path and
+    random requests through the compact target_probs + row map."""
+    # Request 0 is greedy; requests 1 and 2 are random.
+    # Request 0: the target argmax disagrees at position 1, so the second
+    #     draft token is replaced with the argmax token and the bonus token
+    #     is dropped.
+    # Request 1: the target distribution is peaked on the draft tokens, so
+    #     both are accepted and the bonus token is appended.
+    # Request 2: the target distribution is peaked on a different token at
+    #     position 0, so the draft is rejected there and the recovered
+    #     token (the peak) is emitted.
+    spec_tokens = [[1, 2], [3, 4], [5, 6]]
+    output_tokens = [[1, 5, 99], [3, 4, 10], [7, 8, 11]]
+    # -1.0 == GREEDY_TEMPERATURE marks request 0 as greedy.
+    metadata = create_sampling_metadata(
+        all_greedy=False,
+        temperature=torch.tensor([-1.0, 1.0, 1.0],
+                                 dtype=torch.float32,
+                                 device=DEVICE))
+    assert not metadata.all_random
+    logits = create_logits_tensor(output_tokens)
+    bonus_token_tensor = torch.tensor([tokens[-1] for tokens in output_tokens],
+                                      device=DEVICE)
+    spec_decode_metadata = SpecDecodeMetadata.make_dummy(spec_tokens,
+                                                         device=DEVICE)
+
+    output = rejection_sampler(
+        spec_decode_metadata,
+        draft_probs=None,
+        target_logits=logits,
+        bonus_token_ids=bonus_token_tensor,
+        sampling_metadata=metadata,
+    )
+    expected = torch.tensor(
+        [[1, 5, PLACEHOLDER_TOKEN_ID], [3, 4, 10],
+         [7, PLACEHOLDER_TOKEN_ID, PLACEHOLDER_TOKEN_ID]],
+        dtype=torch.int,
+        device=DEVICE)
+    assert torch.equal(output, expected)
@@ -41,3 +41,9 @@ class SamplingMetadata:
 
     # req_index -> bad_words_token_ids
     bad_words_token_ids: dict[int, list[list[int]]]
+
+    # CPU copy of `temperature`, used for CPU-side decisions (e.g. the
+    # compact target_probs layout for mixed batches in the rejection
+    # sampler) without forcing a device sync. Optional: callers that do not
+    # keep a CPU copy may leave it unset.
+    temperature_cpu: Optional[torch.Tensor] = None
@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: Apache-2.0
+from dataclasses import dataclass, replace
 from typing import Optional
 
+import numpy as np
 import torch
 import torch.nn as nn
 import triton
@@ -18,6 +20,10 @@ GREEDY_TEMPERATURE: tl.constexpr = -1
 # Maximum number of speculative draft tokens allowed per request in a single
 # step. This value is chosen to be large enough to handle typical use cases.
 MAX_SPEC_LEN = 32
+# Tile size used to stream vocab-sized rows inside the rejection sampling
+# kernels. A single tile spanning the padded vocab would spill registers
+# for large vocab sizes.
+VOCAB_BLOCK_SIZE = 8192
 
 
 class RejectionSampler(nn.Module):
@@ -43,6 +49,25 @@ class RejectionSampler(nn.Module):
         output tokens = accepted tokens + recovered tokens + bonus tokens
     """
 
+    # Budget for the static input/output buffers pinned by the captured
+    # graphs. The dominant cost is the vocab-sized logits (and draft probs)
+    # buffer per entry, so the cache is bounded by bytes rather than by
+    # entry count; new shapes fall back to eager mode once it is exhausted.
+    MAX_GRAPH_CACHE_BYTES = 128 * 1024 * 1024
+
+    def __init__(self):
+        super().__init__()
+        # CUDA graphs of the sampling kernels, keyed on the padded shapes
+        # and host-side branches that change the captured work. A key is
+        # captured lazily, after one eager warmup run that compiles and
+        # autotunes the Triton kernels outside of the capture.
+        self._graph_cache: dict[tuple, _RejectionSampleGraph] = {}
+        self._warmed_up_keys: set[tuple] = set()
+        self._graph_cache_bytes = 0
+        # All captures share one memory pool so their intermediate buffers
+        # overlap instead of each graph holding a private copy.
+        self._graph_pool = None
+
     def forward(
         self,
         metadata: SpecDecodeMetadata,
@@ -83,26 +108,180 @@ class RejectionSampler(nn.Module):
                 A tensor containing the final output token IDs.
         '''
         assert metadata.max_spec_len <= MAX_SPEC_LEN
-        # [num_tokens, vocab_size]
-        # NOTE(woosuk): `target_logits` can be updated in place inside the
-        # `compute_probs` function.
-        target_probs = compute_probs(
-            target_logits,
-            metadata.cu_num_draft_tokens,
-            sampling_metadata,
-        )
+        if self._use_cuda_graph(target_logits, sampling_metadata):
+            return self._forward_cuda_graph(metadata, draft_probs,
+                                            target_logits, bonus_token_ids,
+                                            sampling_metadata)
+        return _run_rejection_sample(metadata, draft_probs, target_logits,
+                                     bonus_token_ids, sampling_metadata)
+
+    @staticmethod
+    def _use_cuda_graph(
+        target_logits: torch.Tensor,
+        sampling_metadata: SamplingMetadata,
+    ) -> bool:
+        # A sampler-local CUDA graph replaces the half dozen small kernel
+        # launches of the sampling path with a single replay. Restrict the
+        # capture to the common production case, whose captured work is
+        # fully static: all-random batches without per-request generators
+        # (their RNG state is not graph-safe) and without top-k/top-p.
+        return (target_logits.is_cuda and sampling_metadata.all_random
+                and not sampling_metadata.generators
+                and sampling_metadata.top_k is None
+                and sampling_metadata.top_p is None
+                and not torch.cuda.is_current_stream_capturing())
 
-        output_token_ids = rejection_sample(
-            metadata.draft_token_ids,
-            metadata.num_draft_tokens,
+    def _forward_cuda_graph(
+        self,
+        metadata: SpecDecodeMetadata,
+        draft_probs: Optional[torch.Tensor],
+        target_logits: torch.Tensor,
+        bonus_token_ids: torch.Tensor,
+        sampling_metadata: SamplingMetadata,
+    ) -> torch.Tensor:
+        batch_size = len(metadata.num_draft_tokens)
+        num_tokens = target_logits.shape[0]
+        # Decode shapes change step to step, so keying on the raw shapes
+        # would churn through distinct graphs. Pad the capture shapes to
+        # power-of-two buckets (the sampler-level analog of the runner's
+        # fixed cudagraph capture sizes) and copy each step's inputs into
+        # the padded buffers; the padded rows are inert.
+        padded_batch_size = _pad_capture_size(batch_size)
+        padded_num_tokens = _pad_capture_size(num_tokens)
+        key = (
+            padded_batch_size,
+            padded_num_tokens,
             metadata.max_spec_len,
-            metadata.cu_num_draft_tokens,
-            draft_probs,
-            target_probs,
-            bonus_token_ids,
+            target_logits.shape[1],
+            target_logits.dtype,
+            draft_probs is None,
+        )
+        entry = self._graph_cache.get(key)
+        if entry is None:
+            if key not in self._warmed_up_keys:
+                # First occurrence of this shape: run eagerly so the Triton
+                # kernels are compiled and autotuned outside of the capture.
+                self._warmed_up_keys.add(key)
+                return _run_rejection_sample(metadata, draft_probs,
+                                             target_logits, bonus_token_ids,
+                                             sampling_metadata)
+            entry_bytes = _graph_entry_bytes(padded_batch_size,
+                                             padded_num_tokens,
+                                             metadata.max_spec_len,
+                                             target_logits, draft_probs)
+            if self._graph_cache_bytes + entry_bytes > \
+                    self.MAX_GRAPH_CACHE_BYTES:
+                logger.warning_once(
+                    "Rejection sampler CUDA graph cache reached its memory "
+                    "budget; falling back to eager mode for new shapes.")
+                return _run_rejection_sample(metadata, draft_probs,
+                                             target_logits, bonus_token_ids,
+                                             sampling_metadata)
+            entry = self._capture_graph(padded_batch_size, padded_num_tokens,
+                                        metadata, draft_probs, target_logits,
+                                        bonus_token_ids, sampling_metadata)
+            self._graph_cache[key] = entry
+            self._graph_cache_bytes += entry_bytes
+        else:
+            entry.copy_inputs(metadata, draft_probs, target_logits,
+                              bonus_token_ids, sampling_metadata)
+        entry.graph.replay()
+        return entry.output_token_ids[:batch_size]
+
+    def _capture_graph(
+        self,
+        padded_batch_size: int,
+        padded_num_tokens: int,
+        metadata: SpecDecodeMetadata,
+        draft_probs: Optional[torch.Tensor],
+        target_logits: torch.Tensor,
+        bonus_token_ids: torch.Tensor,
+        sampling_metadata: SamplingMetadata,
+    ) -> "_RejectionSampleGraph":
+        batch_size = len(metadata.num_draft_tokens)
+        num_tokens = target_logits.shape[0]
+        vocab_size = target_logits.shape[1]
+        device = target_logits.device
+        # Padded static buffers the graph reads from; only the valid prefix
+        # is refilled before every replay. The padding is initialized so the
+        # padded rows stay inert: zero draft counts (see the clamp in
+        # rejection_sample_kernel) and neutral temperatures.
+        static_draft_token_ids = torch.zeros(
+            padded_num_tokens,
+            dtype=metadata.draft_token_ids.dtype,
+            device=device)
+        static_cu_num_draft_tokens = torch.zeros(
+            padded_batch_size,
+            dtype=metadata.cu_num_draft_tokens.dtype,
+            device=device)
+        static_temperature = torch.ones(
+            padded_batch_size,
+            dtype=sampling_metadata.temperature.dtype,
+            device=device)
+        static_draft_probs = (torch.zeros(
+            (padded_num_tokens, vocab_size),
+            dtype=draft_probs.dtype,
+            device=device) if draft_probs is not None else None)
+        static_target_logits = torch.zeros((padded_num_tokens, vocab_size),
+                                           dtype=target_logits.dtype,
+                                           device=device)
+        static_bonus_token_ids = torch.zeros(
+            (padded_batch_size, ) + bonus_token_ids.shape[1:],
+            dtype=bonus_token_ids.dtype,
+            device=device)
+        # The captured kernels only read the GPU tensors; the host-side
+        # fields (e.g. num_draft_tokens) are only used for shapes, which the
+        # cache key pins.
+        static_metadata = replace(
+            metadata,
+            draft_token_ids=static_draft_token_ids,
+            cu_num_draft_tokens=static_cu_num_draft_tokens,
+            num_draft_tokens=metadata.num_draft_tokens + [0] *
+            (padded_batch_size - batch_size),
+        )
+        static_sampling_metadata = replace(
             sampling_metadata,
+            temperature=static_temperature,
         )
-        return output_token_ids
+        entry = _RejectionSampleGraph(
+            graph=None,
+            draft_token_ids=static_draft_token_ids,
+            cu_num_draft_tokens=static_cu_num_draft_tokens,
+            temperature=static_temperature,
+            draft_probs=static_draft_probs,
+            target_logits=static_target_logits,
+            bonus_token_ids=static_bonus_token_ids,
+            output_token_ids=None,
+        )
+        entry.copy_inputs(metadata, draft_probs, target_logits,
+                          bonus_token_ids, sampling_metadata)
+
+        # One warmup run on a side stream, as required before capturing.
+        # compute_probs updates the logits buffer in place, so it is
+        # restored afterwards. The padded tail rows of the logits buffer may
+        # accumulate garbage across replays; the kernels never read them.
+        warmup_stream = torch.cuda.Stream()
+        warmup_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(warmup_stream):
+            _run_rejection_sample(static_metadata, static_draft_probs,
+                                  static_target_logits,
+                                  static_bonus_token_ids,
+                                  static_sampling_metadata)
+        torch.cuda.current_stream().wait_stream(warmup_stream)
+        static_target_logits[:num_tokens].copy_(target_logits)
+
+        if self._graph_pool is None:
+            self._graph_pool = torch.cuda.graph_pool_handle()
+        graph = torch.cuda.CUDAGraph()
+        # NOTE: torch.cuda.graph makes the default generator graph-safe, so
+        # the torch.rand call inside draws fresh values on every replay.
+        with torch.cuda.graph(graph, pool=self._graph_pool):
+            output_token_ids = _run_rejection_sample(
+                static_metadata, static_draft_probs, static_target_logits,
+                static_bonus_token_ids, static_sampling_metadata)
+        entry.graph = graph
+        entry.output_token_ids = output_token_ids
+        return entry
 
     @staticmethod
     def parse_output(
@@ -122,16 +301,119 @@ class RejectionSampler(nn.Module):
             A list of lists of token IDs.
         """
         output_token_ids_np = output_token_ids.cpu().numpy()
-        # Create mask for valid tokens.
-        valid_mask = ((output_token_ids_np != PLACEHOLDER_TOKEN_ID) &
-                      (output_token_ids_np < vocab_size))
+        # The rejection sampler only emits valid tokens as a prefix of each
+        # row, so it suffices to find the first invalid token (if any) and
+        # drop everything from there on. Slicing the prefix avoids building
+        # a boolean index array per row.
+        invalid_mask = ((output_token_ids_np == PLACEHOLDER_TOKEN_ID) |
+                        (output_token_ids_np >= vocab_size))
+        num_valid_tokens = np.where(invalid_mask.any(axis=1),
+                                    invalid_mask.argmax(axis=1),
+                                    output_token_ids_np.shape[1])
         outputs = [
-            row[valid_mask[i]].tolist()
+            row[:num_valid_tokens[i]].tolist()
             for i, row in enumerate(output_token_ids_np)
         ]
         return outputs
 
 
+@dataclass
+class _RejectionSampleGraph:
+    """A captured CUDA graph of the rejection sampling kernels for one
+    padded shape/branch combination, together with its static I/O buffers.
+
+    `graph` and `output_token_ids` are filled in at the end of the capture.
+    """
+
+    graph: Optional[torch.cuda.CUDAGraph]
+    draft_token_ids: torch.Tensor
+    cu_num_draft_tokens: torch.Tensor
+    temperature: torch.Tensor
+    draft_probs: Optional[torch.Tensor]
+    target_logits: torch.Tensor
+    bonus_token_ids: torch.Tensor
+    output_token_ids: Optional[torch.Tensor]
+
+    def copy_inputs(
+        self,
+        metadata: SpecDecodeMetadata,
+        draft_probs: Optional[torch.Tensor],
+        target_logits: torch.Tensor,
+        bonus_token_ids: torch.Tensor,
+        sampling_metadata: SamplingMetadata,
+    ) -> None:
+        batch_size = len(metadata.num_draft_tokens)
+        num_tokens = target_logits.shape[0]
+        self.draft_token_ids[:num_tokens].copy_(metadata.draft_token_ids)
+        self.cu_num_draft_tokens[:batch_size].copy_(
+            metadata.cu_num_draft_tokens)
+        # Zero the padded tail so rows beyond the real batch see zero draft
+        # tokens; stale values from a previous, larger step would otherwise
+        # make them sample garbage.
+        self.cu_num_draft_tokens[batch_size:].zero_()
+        self.temperature[:batch_size].copy_(sampling_metadata.temperature)
+        if self.draft_probs is not None:
+            self.draft_probs[:num_tokens].copy_(draft_probs)
+        self.target_logits[:num_tokens].copy_(target_logits)
+        self.bonus_token_ids[:batch_size].copy_(bonus_token_ids)
+
+
+def _pad_capture_size(size: int) -> int:
+    """Pad a CUDA graph capture dimension to its power-of-two bucket (with a
+    small floor), so step-to-step shape changes reuse the same graph."""
+    return max(triton.next_power_of_2(size), 8)
+
+
+def _graph_entry_bytes(
+    padded_batch_size: int,
+    padded_num_tokens: int,
+    max_spec_len: int,
+    target_logits: torch.Tensor,
+    draft_probs: Optional[torch.Tensor],
+) -> int:
+    """Bytes of static I/O buffers a captured graph entry would pin."""
+    vocab_size = target_logits.shape[1]
+    num_bytes = (padded_num_tokens * vocab_size *
+                 target_logits.element_size())
+    if draft_probs is not None:
+        num_bytes += (padded_num_tokens * vocab_size *
+                      draft_probs.element_size())
+    # Token id, cu_num_draft, temperature, bonus, and output buffers.
+    num_bytes += 4 * padded_num_tokens
+    num_bytes += padded_batch_size * (4 + 4 + 8 + 4 * (max_spec_len + 1))
+    return num_bytes
+
+
+def _run_rejection_sample(
+    metadata: SpecDecodeMetadata,
+    draft_probs: Optional[torch.Tensor],
+    target_logits: torch.Tensor,
+    bonus_token_ids: torch.Tensor,
+    sampling_metadata: SamplingMetadata,
+) -> torch.Tensor:
+    # NOTE(woosuk): `target_logits` can be updated in place inside the
+    # `compute_probs` function.
+    target_probs, target_probs_row_map = compute_probs(
+        target_logits,
+        metadata.cu_num_draft_tokens,
+        metadata.num_draft_tokens,
+        sampling_metadata,
+    )
+
+    return rejection_sample(
+        metadata.draft_token_ids,
+        metadata.num_draft_tokens,
+        metadata.max_spec_len,
+        metadata.cu_num_draft_tokens,
+        draft_probs,
+        target_logits,
+        target_probs,
+        target_probs_row_map,
+        bonus_token_ids,
+        sampling_metadata,
+    )
+
+
 def rejection_sample(
     # [num_tokens]
     draft_token_ids: torch.Tensor,
@@ -143,7 +425,11 @@ def rejection_sample(
     # [num_tokens, vocab_size]
     draft_probs: Optional[torch.Tensor],
     # [num_tokens, vocab_size]
+    target_logits: torch.Tensor,
+    # [num_tokens, vocab_size] or [num_random_tokens, vocab_size]
     target_probs: torch.Tensor,
+    # [num_tokens] or None
+    target_probs_row_map: Optional[torch.Tensor],
     # [batch_size, 1]
     bonus_token_ids: torch.Tensor,
     sampling_metadata: SamplingMetadata,
@@ -151,6 +437,7 @@ def rejection_sample(
     assert draft_token_ids.ndim == 1
     assert draft_probs is None or draft_probs.ndim == 2
     assert cu_num_draft_tokens.ndim == 1
+    assert target_logits.ndim == 2
     assert target_probs.ndim == 2
 
     batch_size = len(num_draft_tokens)
@@ -159,90 +446,125 @@ def rejection_sample(
     device = target_probs.device
     assert draft_token_ids.is_contiguous()
     assert draft_probs is None or draft_probs.is_contiguous()
+    assert target_logits.is_contiguous()
     assert target_probs.is_contiguous()
     assert bonus_token_ids.is_contiguous()
-    assert target_probs.shape == (num_tokens, vocab_size)
+    if target_probs_row_map is None:
+        assert target_probs.shape == (num_tokens, vocab_size)
+    else:
+        # Compact layout: `target_probs` only holds the rows of random
+        # sampling tokens; `target_probs_row_map` maps flat token indices
+        # to compact rows (its entries for greedy tokens are unused).
+        assert target_probs_row_map.shape == (num_tokens, )
+    # All token id tensors on this path (draft, output, first_reject_pos)
+    # are int32 to halve the bytes moved by the kernels, which is safe as
+    # long as the vocab fits in 31 bits.
+    assert vocab_size < 2**31
+    assert draft_token_ids.dtype == torch.int32
 
-    # Create output buffer.
+    # Create output buffer. No need to fill it with PLACEHOLDER_TOKEN_ID:
+    # the rejection kernel writes every slot of each row, storing the
+    # placeholder into the trailing slots itself.
     output_token_ids = torch.empty(
         (batch_size, max_spec_len + 1),
         dtype=torch.int32,  # Consistent with SamplerOutput.sampled_token_ids.
         device=device,
     )
-    output_token_ids.fill_(PLACEHOLDER_TOKEN_ID)
 
     if sampling_metadata.all_greedy:
+        # Skip the random-path setup entirely.
         is_greedy = None
+        uniform_probs = None
+        first_reject_pos = None
     else:
         is_greedy = sampling_metadata.temperature == GREEDY_TEMPERATURE
-    if not sampling_metadata.all_random:
-        # Rejection sampling for greedy sampling requests.
-        target_argmax = target_probs.argmax(dim=-1)
-        rejection_greedy_sample_kernel[(batch_size, )](
-            output_token_ids,
-            cu_num_draft_tokens,
-            draft_token_ids,
-            target_argmax,
-            bonus_token_ids,
-            is_greedy,
-            max_spec_len,
-            num_warps=1,
+        # Generate uniform probabilities for rejection sampling.
+        # [num_tokens]
+        uniform_probs = generate_uniform_probs(
+            num_tokens,
+            num_draft_tokens,
+            sampling_metadata.generators,
+            device,
         )
-        if sampling_metadata.all_greedy:
-            return output_token_ids
-
-    # Generate uniform probabilities for rejection sampling.
-    # [num_tokens]
-    uniform_probs = generate_uniform_probs(
-        num_tokens,
-        num_draft_tokens,
-        sampling_metadata.generators,
-        device,
-    )
-
-    # Sample recovered tokens for each position.
-    # [num_tokens]
-    recovered_token_ids = sample_recovered_tokens(
-        max_spec_len,
-        num_draft_tokens,
-        cu_num_draft_tokens,
-        draft_token_ids,
-        draft_probs,
-        target_probs,
-        sampling_metadata,
-        device,
-    )
+        # Position of the first rejected draft token per request, or -1 if
+        # all draft tokens were accepted. Filled by the kernel below and
+        # consumed by sample_recovered_tokens.
+        first_reject_pos = torch.empty(batch_size,
+                                       dtype=torch.int32,
+                                       device=device)
 
-    # Rejection sampling for random sampling requests.
-    rejection_random_sample_kernel[(batch_size, )](
+    # A single kernel handles both the greedy and the random sampling
+    # requests, dispatching on `is_greedy` per request. This halves the
+    # kernel launches for mixed batches and avoids the no-op programs that
+    # two separate launches with early exits would run.
+    # NOTE(woosuk): The greedy path reduces each row of `target_logits` to
+    # its argmax in registers instead of materializing an intermediate
+    # [num_tokens] argmax tensor. The raw logits are used because the argmax
+    # is invariant to the softmax, so the greedy path never needs
+    # `target_probs` (see `compute_probs`).
+    rejection_sample_kernel[(batch_size, )](
         output_token_ids,
         cu_num_draft_tokens,
         draft_token_ids,
         draft_probs,
+        target_logits,
         target_probs,
+        target_probs_row_map,
         bonus_token_ids,
-        recovered_token_ids,
+        first_reject_pos,
         uniform_probs,
         is_greedy,
-        max_spec_len,
         vocab_size,
         IS_NGRAM=draft_probs is None,
-        num_warps=1,
+        # NOTE(woosuk): Specializing on the spec len fully unrolls the
+        # per-position loop of the random path. The draft length is fixed
+        # per deployment, so this recompiles only a handful of times.
+        MAX_SPEC_LEN=max_spec_len,
+        # Tile used for the trailing placeholder fill of each output row.
+        PADDED_NUM_SLOTS=triton.next_power_of_2(max_spec_len + 1),
+        BLOCK_SIZE=min(VOCAB_BLOCK_SIZE, triton.next_power_of_2(vocab_size)),
+        num_warps=4,
     )
+
+    if not sampling_metadata.all_greedy:
+        # Sample the recovered token only at the first rejected position of
+        # each request (if any), writing it directly into the output. This
+        # skips the vocab-sized recovered sampling for accepted positions
+        # and for fully-accepted requests.
+        sample_recovered_tokens(
+            max_spec_len,
+            num_draft_tokens,
+            cu_num_draft_tokens,
+            draft_token_ids,
+            draft_probs,
+            target_probs,
+            target_probs_row_map,
+            first_reject_pos,
+            output_token_ids,
+            sampling_metadata,
+            device,
+        )
     return output_token_ids
 
 
 def compute_probs(
     logits: torch.Tensor,  # [num_tokens, vocab_size]
     cu_num_draft_tokens: torch.Tensor,  # [batch_size]
+    num_draft_tokens: list[int],  # [batch_size]
     sampling_metadata: SamplingMetadata,
-) -> torch.Tensor:
+) -> tuple[torch.Tensor, Optional[torch.Tensor]]:
     """Compute probability distribution from logits based on sampling metadata.
 
     This function applies temperature scaling to the logits and converts
     them to probabilities using softmax. For greedy decoding, it returns
     the original logits.
 
+    The softmax is only computed for tokens of random sampling requests:
+    the greedy path consumes the raw logits through an argmax (which is
+    invariant to the softmax). In mixed batches the probabilities are
+    materialized in a compact [num_random_tokens, vocab_size] layout,
+    accompanied by a row map from flat token indices to compact rows.
+
     Args:
         logits: Input logits tensor to be converted to probabilities.
         cu_num_draft_tokens: Cumulative number of draft tokens.
@@ -250,14 +572,14 @@ def compute_probs(
             temperature and whether greedy sampling is used.
 
     Returns:
-        torch.Tensor: Probability distribution (softmax of scaled logits)
-            if non-greedy sampling is used, otherwise returns the
-            original logits.
+        A (target_probs, target_probs_row_map) tuple. The row map is None
+        when the probabilities (or, for all-greedy batches, the original
+        logits) use the flat [num_tokens, vocab_size] layout.
     """
     assert logits.ndim == 2
     assert cu_num_draft_tokens.ndim == 1
     if sampling_metadata.all_greedy:
-        return logits
+        return logits, None
 
     num_tokens = logits.shape[0]
     temperature = expand_batch_to_tokens(
@@ -289,8 +611,46 @@ def compute_probs(
     # NOTE(woosuk): `apply_top_k_top_p` uses sorting to calculate the mask,
     # which is slow for large vocab sizes. This may cause performance issues.
     logits = apply_top_k_top_p(logits, top_k, top_p)
-    output_prob = logits.softmax(dim=-1, dtype=torch.float32)
-    return output_prob
+    if sampling_metadata.all_random:
+        return logits.softmax(dim=-1, dtype=torch.float32), None
+
+    # Mixed batch: only materialize the probabilities of the tokens of
+    # random sampling requests, in a compact [num_random_tokens, vocab_size]
+    # layout. The greedy path reads the raw logits instead (the argmax is
+    # invariant to the softmax), so the rows of greedy tokens are never
+    # allocated, saving their vocab-sized writes entirely. The kernels
+    # locate the compact rows through the row map; its entries for greedy
+    # tokens are meaningless and must never be read.
+    # The compact row indices are built on the CPU from the runner's CPU
+    # copy of the temperatures, keeping the mixed path free of device syncs
+    # (boolean-mask indexing of a CUDA tensor calls nonzero, which
+    # synchronizes).
+    temperature_cpu = sampling_metadata.temperature_cpu
+    if temperature_cpu is not None:
+        req_is_random = (temperature_cpu != GREEDY_TEMPERATURE).numpy()
+        token_is_random = np.repeat(req_is_random, num_draft_tokens)
+        random_token_indices = torch.from_numpy(
+            np.flatnonzero(token_is_random).astype(np.int32)).to(
+                logits.device, non_blocking=True)
+        target_probs_row_map = torch.from_numpy(
+            np.cumsum(token_is_random, dtype=np.int32) - 1).to(
+                logits.device, non_blocking=True)
+        target_probs = logits.index_select(0, random_token_indices).softmax(
+            dim=-1, dtype=torch.float32)
+        return target_probs, target_probs_row_map
+
+    # Fallback for callers that do not provide a CPU temperature copy.
+    # NOTE: The boolean mask indexing below forces a device sync.
+    token_is_random = expand_batch_to_tokens(
+        (sampling_metadata.temperature != GREEDY_TEMPERATURE).to(torch.int32),
+        cu_num_draft_tokens,
+        num_tokens,
+    ).bool()
+    target_probs = logits[token_is_random].softmax(dim=-1,
+                                                   dtype=torch.float32)
+    target_probs_row_map = (torch.cumsum(token_is_random, dim=0) -
+                            1).to(torch.int32)
+    return target_probs, target_probs_row_map
 
 
 def expand_batch_to_tokens(
@@ -370,17 +730,45 @@ def generate_uniform_probs(
         dtype=torch.float32,
         device=device,
     )
+    if not generators:
+        return uniform_probs
+
+    # Overwrite the tokens of seeded requests with a single fused Philox
+    # kernel instead of launching one small RNG kernel per request. The
+    # torch generators are only consulted for their seed and offset; the
+    # offset is advanced on the host so consecutive calls (and steps) draw
+    # fresh values deterministically.
+    start_indices: list[int] = []
+    seeded_num_tokens: list[int] = []
+    seeds: list[int] = []
+    offsets: list[int] = []
     start_idx = 0
     for req_idx, n in enumerate(num_draft_tokens):
         # Do not generate random numbers for requests with no draft tokens.
         # This can be important for reproducibility.
         if n == 0:
             continue
-        end_idx = start_idx + n
         generator = generators.get(req_idx)
         if generator is not None:
-            uniform_probs[start_idx:end_idx].uniform_(generator=generator)
-        start_idx = end_idx
+            offset = generator.get_offset()
+            start_indices.append(start_idx)
+            seeded_num_tokens.append(n)
+            seeds.append(generator.initial_seed())
+            offsets.append(offset)
+            # Advance the generator state as if `n` values were drawn from
+            # it. The Philox offset must stay a multiple of 4.
+            generator.set_offset(offset + 4 * n)
+        start_idx += n
+    if seeds:
+        seeded_uniform_probs_kernel[(len(seeds), )](
+            uniform_probs,
+            torch.tensor(start_indices, dtype=torch.int32, device=device),
+            torch.tensor(seeded_num_tokens, dtype=torch.int32, device=device),
+            torch.tensor(seeds, dtype=torch.int64, device=device),
+            torch.tensor(offsets, dtype=torch.int64, device=device),
+            MAX_NUM_TOKENS=MAX_SPEC_LEN,  # To avoid recompilation.
+            num_warps=1,
+        )
     return uniform_probs
 
 
@@ -393,51 +781,67 @@ def sample_recovered_tokens(
     draft_token_ids: torch.Tensor,
     # [num_tokens, vocab_size]
     draft_probs: Optional[torch.Tensor],
-    # [num_tokens, vocab_size]
+    # [num_tokens, vocab_size] or [num_random_tokens, vocab_size]
     target_probs: torch.Tensor,
+    # [num_tokens] or None
+    target_probs_row_map: Optional[torch.Tensor],
+    # [batch_size]
+    first_reject_pos: torch.Tensor,
+    # [batch_size, max_spec_len + 1]
+    output_token_ids: torch.Tensor,
     sampling_metadata: SamplingMetadata,
     device: torch.device,
-) -> torch.Tensor:
-    # NOTE(woosuk): Create only one distribution for each request.
+) -> None:
+    # NOTE(woosuk): Inverse-CDF sampling needs only one uniform sample per
+    # draft token, instead of a [batch_size, vocab_size] exponential tensor
+    # for Gumbel-max. This eliminates both the vocab-sized RNG and the
+    # vocab-sized read of `q` in the kernel.
+    # The uniforms are drawn for every draft token, not just the rejected
+    # ones, to keep the number of RNG draws independent of the rejection
+    # outcome. This matters for the reproducibility of seeded requests.
     batch_size = len(num_draft_tokens)
+    num_tokens = draft_token_ids.shape[0]
     vocab_size = target_probs.shape[-1]
-    q = torch.empty(
-        (batch_size, vocab_size),
-        dtype=torch.float32,
-        device=device,
+    uniform_probs = generate_uniform_probs(
+        num_tokens,
+        num_draft_tokens,
+        sampling_metadata.generators,
+        device,
     )
-    q.exponential_()
-    for i, generator in sampling_metadata.generators.items():
-        # Do not generate random numbers for requests with no draft tokens.
-        # This can be important for reproducibility.
-        if num_draft_tokens[i] > 0:
-            q[i].exponential_(generator=generator)
 
-    recovered_token_ids = torch.empty_like(draft_token_ids)
-    sample_recovered_tokens_kernel[(batch_size, max_spec_len)](
-        recovered_token_ids,
+    sample_recovered_tokens_kernel[(batch_size, )](
+        output_token_ids,
+        first_reject_pos,
         cu_num_draft_tokens,
         draft_token_ids,
         draft_probs,
         target_probs,
-        q,
+        target_probs_row_map,
+        uniform_probs,
         vocab_size,
-        triton.next_power_of_2(vocab_size),
+        MAX_SPEC_LEN=max_spec_len,
         IS_NGRAM=draft_probs is None,
     )
-    return recovered_token_ids
 
 
-# NOTE(woosuk): Avoid specialization to prevent unnecessary recompilation.
-@triton.jit(do_not_specialize=["max_spec_len"])
-def rejection_greedy_sample_kernel(
+@triton.jit
+def rejection_sample_kernel(
     output_token_ids_ptr,  # [batch_size, max_spec_len + 1]
     cu_num_draft_tokens_ptr,  # [batch_size]
     draft_token_ids_ptr,  # [num_tokens]
-    target_argmax_ptr,  # [num_tokens]
+    draft_probs_ptr,  # [num_tokens, vocab_size] or None
+    target_logits_ptr,  # [num_tokens, vocab_size]
+    target_probs_ptr,  # [num_tokens, vocab_size] or compact (see row map)
+    target_probs_row_map_ptr,  # [num_tokens] or None
     bonus_token_ids_ptr,  # [batch_size]
+    first_reject_pos_ptr,  # [batch_size] or None
+    uniform_probs_ptr,  # [num_tokens] or None
     is_greedy_ptr,  # [batch_size] or None
-    max_spec_len,
+    vocab_size,
+    IS_NGRAM: tl.constexpr,
+    MAX_SPEC_LEN: tl.constexpr,
+    PADDED_NUM_SLOTS: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
 ):
     req_idx = tl.program_id(0)
     # FIXME(woosuk): Because is_greedy_ptr is not None at profiling run,
@@ -446,97 +850,118 @@ def rejection_greedy_sample_kernel(
         is_greedy = True
     else:
         is_greedy = tl.load(is_greedy_ptr + req_idx)
-    if not is_greedy:
-        # Early exit for non-greedy sampling requests.
-        return
 
     if req_idx == 0:
         start_idx = 0
     else:
         start_idx = tl.load(cu_num_draft_tokens_ptr + req_idx - 1)
     end_idx = tl.load(cu_num_draft_tokens_ptr + req_idx)
-    num_draft_tokens = end_idx - start_idx
+    # Clamp for the padded rows of a CUDA graph capture, whose zeroed
+    # cu_num_draft_tokens tail makes end_idx < start_idx.
+    num_draft_tokens = tl.maximum(end_idx - start_idx, 0)
 
     rejected = False
-    for pos in range(num_draft_tokens):
-        if not rejected:
-            draft_token_id = tl.load(draft_token_ids_ptr + start_idx + pos)
-            target_argmax_id = tl.load(target_argmax_ptr + start_idx + pos)
-            tl.store(output_token_ids_ptr + req_idx * (max_spec_len + 1) + pos,
-                     target_argmax_id)
-            if draft_token_id != target_argmax_id:
-                # Reject.
-                rejected = True
-
-    if not rejected:
-        # If all tokens are accepted, append the bonus token.
-        bonus_token_id = tl.load(bonus_token_ids_ptr + req_idx)
-        tl.store(
-            output_token_ids_ptr + req_idx * (max_spec_len + 1) +
-            num_draft_tokens, bonus_token_id)
-
-
-# NOTE(woosuk): Avoid specialization to prevent unnecessary recompilation.
-@triton.jit(do_not_specialize=["max_spec_len"])
-def rejection_random_sample_kernel(
-    output_token_ids_ptr,  # [batch_size, max_spec_len + 1]
-    cu_num_draft_tokens_ptr,  # [batch_size]
-    draft_token_ids_ptr,  # [num_tokens]
-    draft_probs_ptr,  # [num_tokens, vocab_size] or None
-    target_probs_ptr,  # [num_tokens, vocab_size]
-    bonus_token_ids_ptr,  # [batch_size]
-    recovered_token_ids_ptr,  # [num_tokens]
-    uniform_probs_ptr,  # [num_tokens]
-    is_greedy_ptr,  # [batch_size]
-    max_spec_len,
-    vocab_size,
-    IS_NGRAM: tl.constexpr,
-):
-    req_idx = tl.program_id(0)
-    is_greedy = tl.load(is_greedy_ptr + req_idx)
+    reject_pos = -1
+    # First output slot that is not written by this kernel or by
+    # sample_recovered_tokens_kernel; everything from here on is filled
+    # with the placeholder below.
+    fill_start = num_draft_tokens + 1
     if is_greedy:
-        # Early exit for greedy sampling requests.
-        return
-
-    if req_idx == 0:
-        start_idx = 0
+        # The greedy loop is left as a runtime loop on purpose: every
+        # iteration streams a vocab-sized row, so unrolling it would only
+        # bloat the binary without hiding any latency.
+        for pos in range(num_draft_tokens):
+            if not rejected:
+                draft_token_id = tl.load(draft_token_ids_ptr + start_idx +
+                                         pos)
+                # Stream the vocab-sized row and reduce it to its argmax in
+                # registers. NOTE(woosuk): The argmax is invariant to
+                # softmax, so the raw logits can be used directly.
+                row_ptr = target_logits_ptr + (start_idx + pos) * vocab_size
+                target_argmax_id = 0
+                max_prob = float("-inf")
+                for block_start in range(0, vocab_size, BLOCK_SIZE):
+                    vocab_offset = block_start + tl.arange(0, BLOCK_SIZE)
+                    block = tl.load(row_ptr + vocab_offset,
+                                    mask=vocab_offset < vocab_size,
+                                    other=float("-inf")).to(tl.float32)
+                    block_max = tl.max(block, axis=0)
+                    # Use a strict comparison to match the first-occurrence
+                    # tie-breaking of `torch.argmax`.
+                    is_new_max = block_max > max_prob
+                    target_argmax_id = tl.where(
+                        is_new_max,
+                        block_start + tl.argmax(block, axis=0),
+                        target_argmax_id,
+                    )
+                    max_prob = tl.where(is_new_max, block_max, max_prob)
+                tl.store(
+                    output_token_ids_ptr + req_idx * (MAX_SPEC_LEN + 1) + pos,
+                    target_argmax_id)
+                if draft_token_id != target_argmax_id:
+                    # Reject.
+                    rejected = True
+                    fill_start = pos + 1
     else:
-        start_idx = tl.load(cu_num_draft_tokens_ptr + req_idx - 1)
-    end_idx = tl.load(cu_num_draft_tokens_ptr + req_idx)
-    num_draft_tokens = end_idx - start_idx
-
-    rejected = False
-    for pos in range(num_draft_tokens):
-        if not rejected:
-            draft_token_id = tl.load(draft_token_ids_ptr + start_idx + pos)
-            if IS_NGRAM:
-                draft_prob = 1
-            else:
-                draft_prob = tl.load(draft_probs_ptr +
-                                     (start_idx + pos) * vocab_size +
-                                     draft_token_id)
-            target_prob = tl.load(target_probs_ptr +
-                                  (start_idx + pos) * vocab_size +
-                                  draft_token_id)
-            uniform_prob = tl.load(uniform_probs_ptr + start_idx + pos)
-            # NOTE(woosuk): While the draft probability should never be 0,
-            # we check it to avoid NaNs. If it happens to be 0, we reject.
-            if draft_prob > 0 and target_prob / draft_prob >= uniform_prob:
-                # Accept.
-                token_id = draft_token_id
-            else:
-                # Reject. Use recovered token.
-                rejected = True
-                token_id = tl.load(recovered_token_ids_ptr + start_idx + pos)
-            tl.store(output_token_ids_ptr + req_idx * (max_spec_len + 1) + pos,
-                     token_id)
+        # MAX_SPEC_LEN is a constexpr, so this loop is fully unrolled. The
+        # accept test only issues a handful of scalar loads per position,
+        # and unrolling lets the compiler schedule them ahead.
+        for pos in tl.static_range(MAX_SPEC_LEN):
+            if pos < num_draft_tokens and not rejected:
+                draft_token_id = tl.load(draft_token_ids_ptr + start_idx +
+                                         pos)
+                if IS_NGRAM:
+                    draft_prob = 1
+                else:
+                    draft_prob = tl.load(draft_probs_ptr +
+                                         (start_idx + pos) * vocab_size +
+                                         draft_token_id)
+                if target_probs_row_map_ptr is None:
+                    target_row = start_idx + pos
+                else:
+                    # Compact layout (mixed batch): map the flat token index
+                    # to its row among the random sampling tokens.
+                    target_row = tl.load(target_probs_row_map_ptr +
+                                         start_idx + pos)
+                target_prob = tl.load(target_probs_ptr +
+                                      target_row * vocab_size +
+                                      draft_token_id)
+                uniform_prob = tl.load(uniform_probs_ptr + start_idx + pos)
+                # NOTE(woosuk): While the draft probability should never be
+                # 0, we check it to avoid NaNs. If it happens to be 0, we
+                # reject.
+                if draft_prob > 0 and target_prob / draft_prob >= uniform_prob:
+                    # Accept.
+                    tl.store(
+                        output_token_ids_ptr + req_idx * (MAX_SPEC_LEN + 1) +
+                        pos, draft_token_id)
+                else:
+                    # Reject. The recovered token for this position is
+                    # sampled afterwards by sample_recovered_tokens_kernel,
+                    # which writes it directly into the output.
+                    rejected = True
+                    reject_pos = pos
+                    fill_start = pos + 1
 
     if not rejected:
         # If all tokens are accepted, append the bonus token.
         bonus_token_id = tl.load(bonus_token_ids_ptr + req_idx)
         tl.store(
-            output_token_ids_ptr + req_idx * (max_spec_len + 1) +
+            output_token_ids_ptr + req_idx * (MAX_SPEC_LEN + 1) +
             num_draft_tokens, bonus_token_id)
+    if first_reject_pos_ptr is not None:
+        tl.store(first_reject_pos_ptr + req_idx, reject_pos)
+
+    # Fill the trailing slots with the placeholder, so the host does not
+    # need to memset the output buffer before the launch. The slot of a
+    # rejected draft token is excluded: sample_recovered_tokens_kernel
+    # writes the recovered token there afterwards.
+    slot_offset = tl.arange(0, PADDED_NUM_SLOTS)
+    tl.store(output_token_ids_ptr + req_idx * (MAX_SPEC_LEN + 1) +
+             slot_offset,
+             PLACEHOLDER_TOKEN_ID,
+             mask=(slot_offset >= fill_start) &
+             (slot_offset < MAX_SPEC_LEN + 1))
 
 
 # NOTE(woosuk): Avoid specialization to prevent unnecessary recompilation.
@@ -565,67 +990,165 @@ def expand_kernel(
              mask=offset < num_tokens)
 
 
+@triton.jit
+def seeded_uniform_probs_kernel(
+    uniform_probs_ptr,  # [num_tokens]
+    start_indices_ptr,  # [num_seeded_reqs]
+    num_tokens_ptr,  # [num_seeded_reqs]
+    seeds_ptr,  # [num_seeded_reqs]
+    offsets_ptr,  # [num_seeded_reqs]
+    MAX_NUM_TOKENS: tl.constexpr,
+):
+    seeded_req_idx = tl.program_id(0)
+    start_idx = tl.load(start_indices_ptr + seeded_req_idx)
+    num_tokens = tl.load(num_tokens_ptr + seeded_req_idx)
+    seed = tl.load(seeds_ptr + seeded_req_idx)
+    offset = tl.load(offsets_ptr + seeded_req_idx)
+
+    pos = tl.arange(0, MAX_NUM_TOKENS)
+    rand = tl.rand(seed, (offset + pos).to(tl.uint32))
+    tl.store(uniform_probs_ptr + start_idx + pos, rand, mask=pos < num_tokens)
+
+
+# NOTE: Autotuning is safe here: the kernel is read-only on its inputs and
+# writes a deterministic value to a single output slot per program, so the
+# benchmarking re-runs are idempotent. The best tile size and warp count
+# depend mainly on the vocab size (register pressure vs. load parallelism).
+@triton.autotune(
+    configs=[
+        triton.Config({"BLOCK_SIZE": block_size},
+                      num_warps=num_warps,
+                      num_stages=num_stages) for block_size in (4096, 8192)
+        for num_warps in (4, 8) for num_stages in (2, 3, 4)
+    ],
+    key=["vocab_size"],
+)
 @triton.jit
 def sample_recovered_tokens_kernel(
-    output_token_ids_ptr,  # [num_tokens]
+    output_token_ids_ptr,  # [batch_size, max_spec_len + 1]
+    first_reject_pos_ptr,  # [batch_size]
     cu_num_draft_tokens_ptr,  # [batch_size]
     draft_token_ids_ptr,  # [num_tokens]
     draft_probs_ptr,  # [num_tokens, vocab_size] or None
-    target_probs_ptr,  # [num_tokens, vocab_size]
-    q_ptr,  # [batch_size, vocab_size]
+    target_probs_ptr,  # [num_tokens, vocab_size] or compact (see row map)
+    target_probs_row_map_ptr,  # [num_tokens] or None
+    uniform_probs_ptr,  # [num_tokens]
     vocab_size,
-    PADDED_VOCAB_SIZE: tl.constexpr,
+    MAX_SPEC_LEN: tl.constexpr,
+    BLOCK_SIZE: tl.constexpr,
     IS_NGRAM: tl.constexpr,
 ):
     req_idx = tl.program_id(0)
+    # Early exit for greedy requests and requests whose draft tokens were
+    # all accepted.
+    pos = tl.load(first_reject_pos_ptr + req_idx)
+    if pos < 0:
+        return
+
     if req_idx == 0:
         start_idx = 0
     else:
         start_idx = tl.load(cu_num_draft_tokens_ptr + req_idx - 1)
-    end_idx = tl.load(cu_num_draft_tokens_ptr + req_idx)
-    num_draft_tokens = end_idx - start_idx
-
-    # Early exit for out-of-range positions.
-    pos = tl.program_id(1)
-    if pos >= num_draft_tokens:
-        return
 
-    vocab_offset = tl.arange(0, PADDED_VOCAB_SIZE)
     if IS_NGRAM:
         draft_token_id = tl.load(draft_token_ids_ptr + start_idx + pos)
-        orig_prob = tl.load(target_probs_ptr + (start_idx + pos) * vocab_size +
-                            draft_token_id)
-        # Temporarily zero out the probability of the draft token.
-        # This is essentially the same as target_prob - draft_prob, except that
-        # n-gram does not have draft_prob. We regard it as 1.
-        tl.store(
-            target_probs_ptr + (start_idx + pos) * vocab_size + draft_token_id,
-            0)
-        prob = tl.load(target_probs_ptr + (start_idx + pos) * vocab_size +
+    else:
+        # Unused; only passed to keep the helper signature uniform.
+        draft_token_id = 0
+    if target_probs_row_map_ptr is None:
+        target_row = start_idx + pos
+    else:
+        # Compact layout (mixed batch): map the flat token index to its row
+        # among the random sampling tokens.
+        target_row = tl.load(target_probs_row_map_ptr + start_idx + pos)
+
+    # First pass: compute the normalizing constant of the adjusted
+    # distribution, streaming the vocab-sized rows tile by tile.
+    z = 0.0
+    for block_start in range(0, vocab_size, BLOCK_SIZE):
+        vocab_offset = block_start + tl.arange(0, BLOCK_SIZE)
+        prob = load_adjusted_prob(draft_probs_ptr, target_probs_ptr,
+                                  draft_token_id, start_idx + pos, target_row,
+                                  vocab_size, vocab_offset, IS_NGRAM)
+        z += tl.sum(prob)
+
+    # Second pass: sample via inverse CDF, i.e., find the first index whose
+    # running cumulative sum crosses u * z.
+    u = tl.load(uniform_probs_ptr + start_idx + pos)
+    threshold = u * z
+    recovered_id = 0
+    # The last index with nonzero adjusted probability, used as the fallback
+    # when floating-point rounding keeps the second-pass cumulative sum just
+    # below the threshold (u close to 1). Falling back to an arbitrary index
+    # could emit a token whose adjusted probability is exactly 0.
+    last_nonzero_id = 0
+    found = False
+    cumsum = 0.0
+    for block_start in range(0, vocab_size, BLOCK_SIZE):
+        if not found:
+            vocab_offset = block_start + tl.arange(0, BLOCK_SIZE)
+            prob = load_adjusted_prob(draft_probs_ptr, target_probs_ptr,
+                                      draft_token_id, start_idx + pos,
+                                      target_row, vocab_size, vocab_offset,
+                                      IS_NGRAM)
+            tile_cumsum = cumsum + tl.cumsum(prob, axis=0)
+            # NOTE(woosuk): The comparison must be strict: `u` can be exactly
+            # 0, and `>=` would then select a token with zero probability.
+            crossed = (tile_cumsum > threshold) & (vocab_offset < vocab_size)
+            candidate = tl.min(tl.where(crossed, vocab_offset, vocab_size))
+            if candidate < vocab_size:
+                recovered_id = candidate
+                found = True
+            else:
+                tile_last = tl.max(
+                    tl.where((prob > 0) & (vocab_offset < vocab_size),
+                             vocab_offset, -1))
+                last_nonzero_id = tl.where(tile_last >= 0, tile_last,
+                                           last_nonzero_id)
+            cumsum += tl.sum(prob)
+    if not found:
+        recovered_id = last_nonzero_id
+    tl.store(output_token_ids_ptr + req_idx * (MAX_SPEC_LEN + 1) + pos,
+             recovered_id)
+
+
+@triton.jit
+def load_adjusted_prob(
+    draft_probs_ptr,  # [num_tokens, vocab_size] or None
+    target_probs_ptr,  # [num_tokens, vocab_size] or compact
+    draft_token_id,  # Only used when IS_NGRAM is True.
+    token_idx,  # Flat token index, for `draft_probs`.
+    target_row,  # Row index into `target_probs` (mapped when compact).
+    vocab_size,
+    vocab_offset,
+    IS_NGRAM: tl.constexpr,
+):
+    """Load one tile of the adjusted (residual) probability distribution.
+
+    The draft token is masked out with a compare against the tile offsets,
+    so no host-side safe-index tensor (e.g. a placeholder-to-zero rewrite of
+    `draft_token_ids`) is needed: the flattened draft token ids only contain
+    valid vocab entries by construction.
+    """
+    if IS_NGRAM:
+        prob = tl.load(target_probs_ptr + target_row * vocab_size +
                        vocab_offset,
                        mask=vocab_offset < vocab_size,
                        other=0)
+        # Zero out the probability of the draft token in registers.
+        # This is essentially the same as target_prob - draft_prob, except
+        # that n-gram does not have draft_prob. We regard it as 1.
+        # Masking in registers avoids a store + reload + restore round-trip
+        # to global memory and keeps the kernel read-only on `target_probs`.
+        prob = tl.where(vocab_offset == draft_token_id, 0, prob)
     else:
-        draft_prob = tl.load(draft_probs_ptr + (start_idx + pos) * vocab_size +
+        draft_prob = tl.load(draft_probs_ptr + token_idx * vocab_size +
                              vocab_offset,
                              mask=vocab_offset < vocab_size,
                              other=0)
-        target_prob = tl.load(target_probs_ptr +
-                              (start_idx + pos) * vocab_size + vocab_offset,
+        target_prob = tl.load(target_probs_ptr + target_row * vocab_size +
+                              vocab_offset,
                               mask=vocab_offset < vocab_size,
                               other=0)
         prob = tl.maximum(target_prob - draft_prob, 0)
-        # NOTE(woosuk): We don't need `prob = prob / tl.sum(prob)` here because
-        # `tl.argmax` will select the maximum value.
-
-    q = tl.load(q_ptr + req_idx * vocab_size + vocab_offset,
-                mask=vocab_offset < vocab_size,
-                other=float("-inf"))
-    recovered_id = tl.argmax(prob / q, axis=-1)
-    tl.store(output_token_ids_ptr + start_idx + pos, recovered_id)
-
-    if IS_NGRAM:
-        # Restore the original probability.
-        tl.store(
-            target_probs_ptr + (start_idx + pos) * vocab_size + draft_token_id,
-            orig_prob)
+    return prob
@@ -1,5 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
 from dataclasses import dataclass
+from typing import Optional
 
 import numpy as np
 import torch
@@ -20,9 +21,14 @@ class SpecDecodeMetadata:
     bonus_logits_indices: torch.Tensor
     # [num_tokens + batch_size]
     logits_indices: torch.Tensor
+    # Computed from num_draft_tokens when not provided. Callers that already
+    # have it (e.g. from a NumPy reduction) can pass it in to avoid the
+    # Python-level max over the list.
+    max_spec_len: Optional[int] = None
 
     def __post_init__(self):
-        self.max_spec_len = max(self.num_draft_tokens)
+        if self.max_spec_len is None:
+            self.max_spec_len = max(self.num_draft_tokens)
 
     @classmethod
     def make_dummy(
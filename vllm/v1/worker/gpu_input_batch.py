@@ -575,6 +575,8 @@ class InputBatch:
 
         return SamplingMetadata(
             temperature=temperature,
+            temperature_cpu=(None if self.all_greedy else
+                             self.temperature_cpu_tensor[:num_reqs]),
             all_greedy=self.all_greedy,
             all_random=self.all_random,
             top_p=None if self.no_top_p else self.top_p[:num_reqs],
@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import gc
+import itertools
 import time
 import weakref
 from typing import TYPE_CHECKING, Optional, Union
@@ -158,6 +159,23 @@ class GPUModelRunner(LoRAModelRunnerMixin):
         self.use_spec_decode = False
         if self.speculative_config:
             self.use_spec_decode = True
+            # Dedicated stream for copying the spec decode index tensors to
+            # the GPU. Issuing the copy on a side stream lets it overlap with
+            # the kernels already queued on the current stream, which only
+            # waits for the copy (via the event) right before consuming the
+            # indices.
+            self.spec_decode_copy_stream = torch.cuda.Stream()
+            self.spec_decode_copy_event = torch.cuda.Event()
+            # Persistent pinned staging buffer for the spec decode index
+            # arrays, pinned once at startup instead of per step. Sized for
+            # the worst case: cu_num_draft_tokens + bonus_logits_indices
+            # (max_num_reqs each), logits_indices (max_num_tokens +
+            # max_num_reqs), and target_logits_indices (max_num_tokens).
+            self.spec_decode_staging_buffer = torch.empty(
+                3 * self.max_num_reqs + 2 * self.max_num_tokens,
+                dtype=torch.int32,
+                pin_memory=self.pin_memory,
+            )
             if get_pp_group().is_last_rank:
                 if self.speculative_config.method == "ngram":
                     self.drafter = NgramProposer(self.vllm_config)
@@ -376,6 +394,13 @@ class GPUModelRunner(LoRAModelRunnerMixin):
             req_ids_to_add.append(req_id)
 
         # Update the states of the running/resumed requests.
+        # The scheduled spec decode tokens are accumulated here and written
+        # into `token_ids_cpu` with a single vectorized scatter after the
+        # loop, instead of one slice assignment (and list -> ndarray
+        # conversion) per request.
+        spec_token_req_indices: list[int] = []
+        spec_token_start_indices: list[int] = []
+        spec_token_ids_list: list[list[int]] = []
         for req_data in scheduler_output.scheduled_cached_reqs:
             req_id = req_data.req_id
             req_state = self.requests[req_id]
@@ -427,13 +452,39 @@ class GPUModelRunner(LoRAModelRunnerMixin):
             spec_token_ids = scheduler_output.scheduled_spec_decode_tokens.get(
                 req_id, ())
             if spec_token_ids:
-                start_index = end_token_index
+                spec_token_req_indices.append(req_index)
+                spec_token_start_indices.append(end_token_index)
+                spec_token_ids_list.append(spec_token_ids)
                 end_token_index += len(spec_token_ids)
-                self.input_batch.token_ids_cpu[
-                    req_index, start_index:end_token_index] = spec_token_ids
             # NOTE(woosuk): `num_tokens` here may include spec decode tokens.
             self.input_batch.num_tokens[req_index] = end_token_index
 
+        if spec_token_ids_list:
+            # Scatter all the scheduled spec decode tokens at once.
+            # NOTE: This must happen before the batch is re-ordered below by
+            # add_request/condense, which may move rows.
+            num_spec_tokens = np.fromiter(
+                (len(ids) for ids in spec_token_ids_list),
+                dtype=np.int32,
+                count=len(spec_token_ids_list))
+            cu_num_spec_tokens = np.cumsum(num_spec_tokens)
+            total_num_spec_tokens = int(cu_num_spec_tokens[-1])
+            flat_spec_token_ids = np.fromiter(
+                itertools.chain.from_iterable(spec_token_ids_list),
+                dtype=np.int32,
+                count=total_num_spec_tokens)
+            row_indices = np.repeat(
+                np.asarray(spec_token_req_indices, dtype=np.int32),
+                num_spec_tokens)
+            col_offsets = (self.arange_np[:total_num_spec_tokens] -
+                           np.repeat(cu_num_spec_tokens - num_spec_tokens,
+                                     num_spec_tokens))
+            col_indices = np.repeat(
+                np.asarray(spec_token_start_indices, dtype=np.int32),
+                num_spec_tokens) + col_offsets
+            self.input_batch.token_ids_cpu[row_indices,
+                                           col_indices] = flat_spec_token_ids
+
         # Check if the batch has changed. If not, we can skip copying the
         # sampling metadata from CPU to GPU.
         batch_changed = len(removed_req_indices) > 0 or len(req_ids_to_add) > 0
@@ -804,15 +855,32 @@ class GPUModelRunner(LoRAModelRunnerMixin):
         # [0, 1, 2, 5, 6, 9]
         target_logits_indices += arange
 
-        # TODO: Optimize the CPU -> GPU copy.
-        cu_num_draft_tokens = torch.from_numpy(cu_num_draft_tokens).to(
-            self.device, non_blocking=True)
-        logits_indices = torch.from_numpy(logits_indices).to(self.device,
-                                                             non_blocking=True)
-        target_logits_indices = torch.from_numpy(target_logits_indices).to(
-            self.device, non_blocking=True)
-        bonus_logits_indices = torch.from_numpy(bonus_logits_indices).to(
-            self.device, non_blocking=True)
+        # Pack the index arrays into a single pinned staging buffer and issue
+        # one async H2D copy on the dedicated copy stream, so the transfer
+        # overlaps with the kernels already queued on the current stream.
+        sizes = (
+            cu_num_draft_tokens.shape[0],
+            logits_indices.shape[0],
+            target_logits_indices.shape[0],
+            bonus_logits_indices.shape[0],
+        )
+        # The staging buffer is reused across steps; wait until the previous
+        # copy has drained before overwriting it. Only the valid prefix is
+        # written, so there is no per-step re-fill of the buffer.
+        self.spec_decode_copy_event.synchronize()
+        staging = self.spec_decode_staging_buffer[:sum(sizes)]
+        np.concatenate((cu_num_draft_tokens, logits_indices,
+                        target_logits_indices, bonus_logits_indices),
+                       out=staging.numpy())
+        copy_stream = self.spec_decode_copy_stream
+        with torch.cuda.stream(copy_stream):
+            packed_indices = staging.to(self.device, non_blocking=True)
+            self.spec_decode_copy_event.record(copy_stream)
+        # The current stream waits only when the indices are consumed below.
+        torch.cuda.current_stream().wait_event(self.spec_decode_copy_event)
+        packed_indices.record_stream(torch.cuda.current_stream())
+        (cu_num_draft_tokens, logits_indices, target_logits_indices,
+         bonus_logits_indices) = packed_indices.split(sizes)
 
         # Compute the draft token ids.
         # draft_token_indices:      [  1,   2,   3, 105, 106, 208]
@@ -826,6 +894,7 @@ class GPUModelRunner(LoRAModelRunnerMixin):
             target_logits_indices=target_logits_indices,
             bonus_logits_indices=bonus_logits_indices,
             logits_indices=logits_indices,
+            max_spec_len=int(num_draft_tokens.max()),
         )
         return metadata
 